@@ -10,6 +10,43 @@ class Settings:
         self.db_host = os.getenv('DB_HOST')
         self.db_port = int(os.getenv('DB_PORT'))
         self.db_password = os.getenv('DB_PASSWORD')
-    
+
+        # read replicas, comma separated full database urls
+        self.db_replica_urls = [
+            url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()
+        ]
+        self.db_replica_strategy = os.getenv('DB_REPLICA_STRATEGY', 'round_robin')
+        # 0 disables the replication lag check
+        self.db_replica_max_lag_seconds = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 0))
+        self.db_replica_lag_check_interval = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+        self.db_replica_connect_timeout = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2))
+        # how long a client's reads follow its last write (write_lsn cookie lifetime), 0 disables it
+        self.db_read_after_write_seconds = float(os.getenv('DB_READ_AFTER_WRITE_SECONDS', 0))
+
+        # /get-datas page cache, off (0) by default: it is per worker, so other
+        # workers serve pages up to this old after a write
+        self.query_cache_ttl_seconds = float(os.getenv('QUERY_CACHE_TTL_SECONDS', 0))
+        self.query_cache_max_entries = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 1024))
+        self.query_cache_max_rows = int(os.getenv('QUERY_CACHE_MAX_ROWS', 100000))
+
+        # retention policy enforcement
+        self.retention_enabled = os.getenv('RETENTION_ENABLED', 'true').lower() == 'true'
+        self.retention_interval_seconds = float(os.getenv('RETENTION_INTERVAL_SECONDS', 300))
+
+        # profiling, both off by default
+        self.server_timing_enabled = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+        self.profiler_enabled = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+        self.profiler_token = os.getenv('PROFILER_TOKEN')
+        self.profiler_max_seconds = float(os.getenv('PROFILER_MAX_SECONDS', 60))
+
+        # background jobs (long running queries and exports)
+        self.job_workers = int(os.getenv('JOB_WORKERS', 2))
+        self.job_max_retained = int(os.getenv('JOB_MAX_RETAINED', 100))
+        # must be storage shared by every worker and container, job results are written here
+        self.job_export_dir = os.getenv('JOB_EXPORT_DIR', '/tmp/postgresql_connector_exports')
+        self.job_cancel_poll_seconds = float(os.getenv('JOB_CANCEL_POLL_SECONDS', 1))
+        # pending or running jobs whose worker has not sent a heartbeat for this long are failed
+        self.job_heartbeat_timeout_seconds = float(os.getenv('JOB_HEARTBEAT_TIMEOUT_SECONDS', 30))
+
     def get_full_db_url(self):
-        return f'postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}'
\ No newline at end of file
+        return f'postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}'
@@ -1,41 +1,118 @@
 from sqlalchemy.types import (
     String,
     Integer,
+    SmallInteger,
     Boolean,
     DateTime,
+    Date,
     Float,
+    Numeric,
+    LargeBinary,
 )
-from typing import Dict
-from schemas import TableSchema
-from sqlalchemy import MetaData, Table, Column, inspect, text, func, BigInteger
+from typing import Dict, List, Optional
+from schemas import TableSchema, BatchOperation
+from sqlalchemy import MetaData, Table, Column, inspect, text, func, select, BigInteger
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy.dialects.postgresql import UUID, JSONB, REAL, DOUBLE_PRECISION
 from uuid import uuid4
-
+from functools import partial
+import re
+from requestSerialization import bind_row, serialize_row
+from models import RetentionPolicy, RetentionRun
+from profiling import timed_phase
+
+
+# Planner-style estimate: reltuples scaled by the table's current page count,
+# falling back to the stats collector before the table was first analyzed.
+TABLE_STATS_QUERY = text("""
+    SELECT
+        CASE
+            WHEN c.reltuples < 0 OR c.relpages = 0 THEN COALESCE(s.n_live_tup, 0)
+            ELSE (c.reltuples / c.relpages
+                  * (pg_relation_size(c.oid) / current_setting('block_size')::int))::bigint
+        END AS estimated_row_count,
+        s.n_live_tup AS live_tuples,
+        s.n_dead_tup AS dead_tuples,
+        pg_table_size(c.oid) AS table_size_bytes,
+        pg_indexes_size(c.oid) AS indexes_size_bytes,
+        pg_total_relation_size(c.oid) AS total_size_bytes,
+        s.last_vacuum,
+        s.last_autovacuum,
+        s.last_analyze,
+        s.last_autoanalyze
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relname = :table_name
+      AND n.nspname = current_schema()
+      AND c.relkind IN ('r', 'p')
+""")
+
+# upper bound for the exact count(*) of get_table_stats, 0 would disable the timeout
+MAX_EXACT_COUNT_TIMEOUT_MS = 60000
 
 type_mapping = {
     "string": String,
     "integer": Integer,
     "boolean": Boolean,
     "datetime": DateTime,
-    "float": Float
+    "float": Float,
+    "bigint": BigInteger,
+    "smallint": SmallInteger,
+    "real": REAL,
+    "double": DOUBLE_PRECISION,
+    "timestamptz": partial(DateTime, timezone=True),
+    "date": Date,
+    "uuid": UUID,
+    "jsonb": JSONB,
+    "bytea": LargeBinary,
+}
+
+# types that take arguments, e.g. numeric(18,5) or varchar(64)
+parameterized_type_mapping = {
+    "numeric": Numeric,
+    "varchar": String,
 }
 
+_parameterized_type_pattern = re.compile(r"^(\w+)\s*\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\)$")
+
+
+def resolve_column_type(type_name: str):
+    type_name = type_name.lower().strip()
+    if type_name in type_mapping:
+        return type_mapping[type_name]()
+    if type_name in parameterized_type_mapping:
+        return parameterized_type_mapping[type_name]()
+
+    match = _parameterized_type_pattern.match(type_name)
+    if match and match.group(1) in parameterized_type_mapping:
+        name, first, second = match.groups()
+        if name == "varchar" and second is not None:
+            raise Exception(f"Unsupported data type: {type_name}. varchar takes a single length argument")
+        args = [int(first)] + ([int(second)] if second is not None else [])
+        return parameterized_type_mapping[name](*args)
+
+    raise Exception(
+        f"Unsupported data type: {type_name}. Supported types are: "
+        f"{list(type_mapping.keys()) + ['numeric(p,s)', 'varchar(n)']}"
+    )
+
 class DataBaseCrud:
     def __init__(self, db) -> None:
         self.db: Session = db
 
     def get_table_structure(self, table_name: str):
         try:
-            inspector = inspect(self.db.bind)
-            if not inspector.has_table(table_name):
-                raise ValueError(f"Table '{table_name}' does not exist")
-            
-            metadata = MetaData()
+            with timed_phase("reflect"):
+                inspector = inspect(self.db.bind)
+                if not inspector.has_table(table_name):
+                    raise ValueError(f"Table '{table_name}' does not exist")
+                
+                metadata = MetaData()
 
-            table = Table(table_name, metadata, autoload_with=self.db.bind)
+                table = Table(table_name, metadata, autoload_with=self.db.bind)
 
             return table
         except Exception as raised_exception:
@@ -69,14 +146,9 @@ class DataBaseCrud:
                                 onupdate=func.extract('epoch', func.now())))
 
             for col in table_data.columns:
-                if col.type.lower() not in type_mapping:
-                    raise Exception(
-                        f"Unsupported data type: {col.type}. Supported types are: {list(type_mapping.keys())}"
-                    )
-                
                 column = Column(
                     col.name,
-                    type_mapping[col.type.lower()](),
+                    resolve_column_type(col.type),
                     nullable=col.nullable,
                     unique=col.unique
                 )
@@ -119,12 +191,12 @@ class DataBaseCrud:
                 raise ValueError(f"Invalid columns: {invalid_columns}")
 
             with self.db.begin():
-                filtered_data = {k: v for k, v in data.items() if k in valid_columns}
+                filtered_data = bind_row(table, {k: v for k, v in data.items() if k in valid_columns})
                 # filtered_data['id'] = uuid4()
                 result = self.db.execute(table.insert().values(**filtered_data))
 
             return {
-                "data": [filtered_data]
+                "data": [serialize_row(filtered_data, table)]
             }
         except SQLAlchemyError as db_error:
             raise ValueError(f"Database error: {str(db_error)}")
@@ -161,7 +233,7 @@ class DataBaseCrud:
         # Execute and convert to dict
         results = query.all()
 
-        return [dict(zip(column_names, row)) for row in results]
+        return [serialize_row(dict(zip(column_names, row)), table) for row in results]
         
     def update_table_record_by_id(self, table_name: str, id: UUID, data: Dict):
         try:
@@ -181,10 +253,10 @@ class DataBaseCrud:
             if invalid_columns:
                 raise ValueError(f"Invalid columns: {invalid_columns}")
 
-            filtered_data = {
+            filtered_data = bind_row(table, {
                 k: v for k, v in data.items() 
                 if k in valid_columns and k not in ['id', 'created_at', 'updated_at']
-            }
+            })
 
             if not filtered_data:
                 raise ValueError("No valid columns to update")
@@ -207,7 +279,7 @@ class DataBaseCrud:
                 data = self.db.execute(data)
             column_names = [col.name for col in table.columns]
             data = data.first()
-            return dict(zip(column_names,data))
+            return serialize_row(dict(zip(column_names,data)), table)
         except SQLAlchemyError as db_error:
             raise ValueError(f"Database error: {str(db_error)}")
         except Exception as e:
@@ -231,7 +303,7 @@ class DataBaseCrud:
                 data = self.db.execute(data)
             column_names = [col.name for col in table.columns]
             data = data.first()
-            return dict(zip(column_names,data))
+            return serialize_row(dict(zip(column_names,data)), table)
         except SQLAlchemyError as db_error:
             raise ValueError(f"Database error: {str(db_error)}")
         except Exception as e:
@@ -296,7 +368,7 @@ class DataBaseCrud:
                 if result.returns_rows:
                     rows = result.fetchall()
                     columns = result.keys()
-                    rows_as_dict = [dict(zip(columns, row)) for row in rows]
+                    rows_as_dict = [serialize_row(dict(zip(columns, row))) for row in rows]
                     return {
                         "rows":rows_as_dict,
                         "rows_count": len(rows_as_dict),
@@ -307,4 +379,212 @@ class DataBaseCrud:
                     }
         except Exception as raised_exception:
             self.db.rollback()
-            raise ValueError(f"Error executing SQL command: {str(raised_exception)}")
\ No newline at end of file
+            raise ValueError(f"Error executing SQL command: {str(raised_exception)}")
+
+    def execute_batch(self, operations: List[BatchOperation]):
+        """Runs insert/update/delete operations in order inside a single
+        transaction. Any failing operation rolls back the whole batch."""
+        try:
+            if not operations:
+                raise ValueError("Batch must contain at least one operation")
+
+            tables = {}
+            for index, operation in enumerate(operations):
+                if operation.operation.lower() not in ('insert', 'update', 'delete'):
+                    raise ValueError(
+                        f"Operation {index}: unsupported operation '{operation.operation}'. "
+                        "Supported operations are: ['insert', 'update', 'delete']"
+                    )
+                if not operation.table_name.isalnum():
+                    raise ValueError(f"Operation {index}: invalid table name")
+                if operation.operation.lower() in ('update', 'delete') and operation.id is None:
+                    raise ValueError(f"Operation {index}: id is required for {operation.operation}")
+                if operation.table_name not in tables:
+                    tables[operation.table_name] = self.get_table_structure(operation.table_name)
+                if operation.operation.lower() in ('update', 'delete') and 'id' not in tables[operation.table_name].c:
+                    raise ValueError(
+                        f"Operation {index}: table '{operation.table_name}' has no id column to {operation.operation.lower()} by"
+                    )
+
+            results = []
+            with self.db.begin():
+                for index, operation in enumerate(operations):
+                    table = tables[operation.table_name]
+                    operation_name = operation.operation.lower()
+                    valid_columns = {col.name for col in table.columns}
+                    invalid_columns = set(operation.data.keys()) - valid_columns
+
+                    if invalid_columns:
+                        raise ValueError(f"Operation {index}: invalid columns: {invalid_columns}")
+
+                    if operation_name == 'insert':
+                        stmt = table.insert().values(**bind_row(table, operation.data)).returning(*table.columns)
+                    elif operation_name == 'update':
+                        filtered_data = bind_row(table, {
+                            k: v for k, v in operation.data.items()
+                            if k not in ['id', 'created_at', 'updated_at']
+                        })
+                        if not filtered_data:
+                            raise ValueError(f"Operation {index}: no valid columns to update")
+                        stmt = (
+                            table.update()
+                            .where(table.c.id == operation.id)
+                            .values(**filtered_data)
+                            .returning(*table.columns)
+                        )
+                    else:
+                        stmt = table.delete().where(table.c.id == operation.id)
+
+                    result = self.db.execute(stmt)
+                    row = result.first() if result.returns_rows else None
+                    rows_affected = 1 if row is not None else result.rowcount
+
+                    if operation_name != 'insert' and rows_affected == 0:
+                        raise ValueError(f"Operation {index}: no record found with id {operation.id}")
+
+                    results.append({
+                        "index": index,
+                        "operation": operation_name,
+                        "table_name": operation.table_name,
+                        "rows_affected": rows_affected,
+                        "data": serialize_row(row._asdict(), table) if row is not None else None,
+                    })
+
+            return {"results": results}
+        except SQLAlchemyError as db_error:
+            raise ValueError(f"Database error: {str(db_error)}")
+        except Exception as e:
+            raise ValueError(str(e))
+
+    def get_table_stats(
+        self,
+        table_name: str,
+        exact_count: bool = False,
+        exact_count_timeout_ms: int = 5000
+    ):
+        try:
+            if not table_name.isalnum():
+                raise ValueError("Invalid table name")
+            if exact_count and not 1 <= exact_count_timeout_ms <= MAX_EXACT_COUNT_TIMEOUT_MS:
+                raise ValueError(
+                    f"exact_count_timeout_ms must be between 1 and {MAX_EXACT_COUNT_TIMEOUT_MS}"
+                )
+
+            table = self.get_table_structure(table_name)
+
+            with self.db.begin():
+                row = self.db.execute(TABLE_STATS_QUERY, {"table_name": table_name}).first()
+            if row is None:
+                raise ValueError(f"Table '{table_name}' does not exist")
+
+            stats = dict(row._mapping)
+            stats["table_name"] = table_name
+            stats["exact_row_count"] = None
+            stats["exact_count_timed_out"] = False
+
+            if exact_count:
+                try:
+                    with self.db.begin():
+                        self.db.execute(text(f"SET LOCAL statement_timeout = {int(exact_count_timeout_ms)}"))
+                        stats["exact_row_count"] = self.db.execute(
+                            select(func.count()).select_from(table)
+                        ).scalar()
+                except OperationalError as timeout_error:
+                    if getattr(timeout_error.orig, "pgcode", None) != "57014":
+                        raise
+                    stats["exact_count_timed_out"] = True
+
+            return stats
+        except SQLAlchemyError as db_error:
+            raise ValueError(f"Database error: {str(db_error)}")
+        except Exception as e:
+            raise ValueError(str(e))
+
+    def get_estimated_row_count(self, table_name: str):
+        row = self.db.execute(TABLE_STATS_QUERY, {"table_name": table_name}).first()
+        return row.estimated_row_count if row is not None else None
+
+    def set_retention_policy(
+        self,
+        table_name: str,
+        keep_days: int,
+        batch_size: int,
+        sleep_ms: int,
+        enabled: bool
+    ):
+        try:
+            if not table_name.isalnum():
+                raise ValueError("Invalid table name")
+            if keep_days <= 0 or batch_size <= 0 or sleep_ms < 0:
+                raise ValueError("keep_days and batch_size must be positive and sleep_ms not negative")
+
+            table = self.get_table_structure(table_name)
+            if 'created_at' not in table.c:
+                raise ValueError(
+                    f"Table '{table_name}' has no created_at column, create it with generate_datetime_columns"
+                )
+
+            RetentionPolicy.__table__.create(self.db.bind, checkfirst=True)
+            RetentionRun.__table__.create(self.db.bind, checkfirst=True)
+            with self.db.begin():
+                policy = self.db.get(RetentionPolicy, table_name)
+                if policy is None:
+                    policy = RetentionPolicy(table_name=table_name)
+                    self.db.add(policy)
+                policy.keep_days = keep_days
+                policy.batch_size = batch_size
+                policy.sleep_ms = sleep_ms
+                policy.enabled = enabled
+                policy_dict = self._retention_policy_to_dict(policy, self.db.get(RetentionRun, table_name))
+            return policy_dict
+        except SQLAlchemyError as db_error:
+            raise ValueError(f"Database error: {str(db_error)}")
+        except Exception as e:
+            raise ValueError(str(e))
+
+    def get_retention_policies(self):
+        try:
+            RetentionPolicy.__table__.create(self.db.bind, checkfirst=True)
+            RetentionRun.__table__.create(self.db.bind, checkfirst=True)
+            with self.db.begin():
+                policies = (
+                    self.db.query(RetentionPolicy, RetentionRun)
+                    .outerjoin(RetentionRun, RetentionRun.table_name == RetentionPolicy.table_name)
+                    .order_by(RetentionPolicy.table_name)
+                    .all()
+                )
+                return [self._retention_policy_to_dict(policy, run) for policy, run in policies]
+        except SQLAlchemyError as db_error:
+            raise ValueError(f"Database error: {str(db_error)}")
+
+    def delete_retention_policy(self, table_name: str):
+        try:
+            RetentionPolicy.__table__.create(self.db.bind, checkfirst=True)
+            RetentionRun.__table__.create(self.db.bind, checkfirst=True)
+            with self.db.begin():
+                policy = self.db.get(RetentionPolicy, table_name)
+                if policy is None:
+                    raise ValueError(f"No retention policy for table '{table_name}'")
+                self.db.delete(policy)
+                self.db.query(RetentionRun).filter(RetentionRun.table_name == table_name).delete()
+            return {"detail": f"Retention policy for '{table_name}' deleted successfully"}
+        except SQLAlchemyError as db_error:
+            raise ValueError(f"Database error: {str(db_error)}")
+        except Exception as e:
+            raise ValueError(str(e))
+
+    def _retention_policy_to_dict(self, policy: RetentionPolicy, run: Optional[RetentionRun] = None):
+        # metrics of the latest run, left to the schema defaults before the first one
+        metrics = {
+            column.name: getattr(run, column.name)
+            for column in RetentionRun.__table__.columns
+            if run is not None and getattr(run, column.name) is not None
+        }
+        return {
+            **metrics,
+            "table_name": policy.table_name,
+            "keep_days": policy.keep_days,
+            "batch_size": policy.batch_size,
+            "sleep_ms": policy.sleep_ms,
+            "enabled": policy.enabled,
+        }
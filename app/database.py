@@ -1,10 +1,17 @@
-from fastapi import Depends
-from sqlalchemy import create_engine
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from config import Settings
-from typing import Optional, Iterable
+from profiling import TimedQueuePool, install_query_timing
+from typing import Optional, Iterable, List, Dict, Tuple
 from sqlalchemy.engine import Engine as Database
+import itertools
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
 
 app_settings = Settings()
 
@@ -21,21 +28,207 @@ def get_db_sess_new_session():
     return sessionmaker(autocommit=False, autoflush=False, bind=local_engine)
 
 
+REPLICA_STATUS_QUERY = text("""
+    SELECT
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END AS lag_seconds,
+        pg_last_wal_replay_lsn()::text AS replay_lsn
+""")
+
+CURRENT_WRITE_POSITION_QUERY = text("SELECT pg_current_wal_lsn()::text")
+
+# Clients carry the primary's WAL position after their last write and send it
+# back on reads, so routing a read never needs a round trip to the primary.
+WRITE_POSITION_HEADER = "X-Write-LSN"
+WRITE_POSITION_COOKIE = "write_lsn"
+
+
+def parse_lsn(lsn: Optional[str]) -> Optional[int]:
+    """'16/B374D848' -> comparable integer. Raises ValueError when malformed."""
+
+    if lsn is None:
+        return None
+    high, low = lsn.strip().split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+_sql_comment_pattern = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_read_only_sql_pattern = re.compile(r"^\s*(select|with|show|explain|values|table)\b", re.IGNORECASE)
+_write_sql_pattern = re.compile(
+    r"\b(insert|update|delete|merge|create|alter|drop|truncate|grant|revoke|copy|call|do|"
+    r"lock|vacuum|analyze|refresh|reindex|cluster|comment|set|reset|into|nextval|setval)\b",
+    re.IGNORECASE,
+)
+
+
+def is_read_only_sql(sql_command: str) -> bool:
+    """Conservative check used to route raw SQL. Anything that is not a single
+    plain read (or that mentions a writing keyword anywhere) counts as a write."""
+
+    sql = _sql_comment_pattern.sub(" ", sql_command).strip().rstrip(";")
+    if not sql or ";" in sql:
+        return False
+    return bool(_read_only_sql_pattern.match(sql)) and not _write_sql_pattern.search(sql)
+
+
+class ReplicaRouter:
+    """Picks the engine for read-only work: a replica chosen round robin or by
+    fewest checked out connections, falling back to the primary when none
+    qualifies.
+
+    A background thread probes each replica's lag and replay position every
+    `lag_check_interval` seconds, so requests only read cached state.
+    Replicas whose last probe failed are skipped, and with `max_lag_seconds`
+    set so are lagging ones. With `read_after_write_seconds` set, writes hand
+    the client the primary's WAL position; reads carrying one only go to
+    replicas that have replayed past it."""
+
+    def __init__(
+        self,
+        primary: Database,
+        replicas: List[Database],
+        strategy: str = "round_robin",
+        max_lag_seconds: float = 0,
+        lag_check_interval: float = 5,
+        read_after_write_seconds: float = 0,
+    ) -> None:
+        if strategy not in ("round_robin", "least_loaded"):
+            raise ValueError(f"Unsupported replica strategy: {strategy}")
+
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.read_after_write_seconds = read_after_write_seconds
+        self._counter = itertools.count()
+        # replica index -> (lag seconds, replay lsn)
+        self._status: Dict[int, Tuple[float, Optional[int]]] = {}
+        self._stop_event = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.replicas:
+            self._prober = threading.Thread(target=self._probe_loop, name="replica-prober", daemon=True)
+            self._prober.start()
+
+    def current_write_position(self) -> Optional[str]:
+        """The primary's WAL position to hand a client after its write, None
+        when read-after-write routing is off."""
+
+        if not self.read_after_write_seconds or not self.replicas:
+            return None
+        try:
+            with self.primary.connect() as connection:
+                return connection.execute(CURRENT_WRITE_POSITION_QUERY).scalar()
+        except Exception:
+            logger.exception("Could not read the primary's write position")
+            return None
+
+    def route_read(self, required_lsn: Optional[int] = None) -> Tuple[Database, bool]:
+        """Returns the engine for a read and whether the read follows the
+        client's own recent write at `required_lsn`. Such reads must not be
+        served from a cache filled before that write, whichever engine
+        serves them."""
+
+        read_after_write = required_lsn is not None
+        if not self.replicas:
+            return self.primary, read_after_write
+
+        candidates = [
+            replica for index, replica in enumerate(self.replicas)
+            if self._is_eligible(index, required_lsn)
+        ]
+        if not candidates:
+            return self.primary, read_after_write
+
+        if self.strategy == "least_loaded":
+            return min(candidates, key=lambda replica: replica.pool.checkedout()), read_after_write
+        return candidates[next(self._counter) % len(candidates)], read_after_write
+
+    def dispose(self):
+        self._stop_event.set()
+        if self._prober:
+            self._prober.join(timeout=10)
+        for replica in self.replicas:
+            replica.dispose()
+
+    def _is_eligible(self, index: int, required_lsn: Optional[int]) -> bool:
+        # not probed yet, or the last probe failed
+        status = self._status.get(index)
+        if status is None:
+            return False
+        lag, replay_lsn = status
+        if self.max_lag_seconds and lag > self.max_lag_seconds:
+            return False
+        if required_lsn is not None and (replay_lsn is None or replay_lsn < required_lsn):
+            return False
+        return True
+
+    def _probe_loop(self):
+        while not self._stop_event.is_set():
+            for index, replica in enumerate(self.replicas):
+                self._probe(index, replica)
+            self._stop_event.wait(self.lag_check_interval)
+
+    def _probe(self, index: int, replica: Database):
+        try:
+            with replica.connect() as connection:
+                row = connection.execute(REPLICA_STATUS_QUERY).first()
+            self._status[index] = (float(row.lag_seconds), parse_lsn(row.replay_lsn))
+        except Exception as raised_exception:
+            logger.warning("Replica %s probe failed: %s", index, raised_exception)
+            self._status.pop(index, None)
+
+
 _db_conn: Optional[Database] = None
+_replica_router: Optional[ReplicaRouter] = None
 
 def open_db_connections():
-    global _db_conn
+    global _db_conn, _replica_router
     _db_conn = get_engine()
+    _replica_router = ReplicaRouter(
+        primary=_db_conn,
+        replicas=[
+            create_timed_engine(
+                url,
+                pool_pre_ping=True,
+                connect_args={"connect_timeout": app_settings.db_replica_connect_timeout},
+            )
+            for url in app_settings.db_replica_urls
+        ],
+        strategy=app_settings.db_replica_strategy,
+        max_lag_seconds=app_settings.db_replica_max_lag_seconds,
+        lag_check_interval=app_settings.db_replica_lag_check_interval,
+        read_after_write_seconds=app_settings.db_read_after_write_seconds,
+    )
+    _replica_router.start()
 
 
 def close_db_connections():
-    global _db_conn
+    global _db_conn, _replica_router
+    if _replica_router:
+        _replica_router.dispose()
     if _db_conn:
         _db_conn.dispose()
 
 
 def get_engine():
-    return create_engine(app_settings.get_full_db_url())
+    return create_timed_engine(app_settings.get_full_db_url())
+
+
+def create_timed_engine(url: str, **kwargs) -> Database:
+    """create_engine that, with SERVER_TIMING_ENABLED, reports its pool waits
+    and SQL time in the Server-Timing header."""
+
+    if not app_settings.server_timing_enabled:
+        return create_engine(url, **kwargs)
+    timed_engine = create_engine(url, poolclass=TimedQueuePool, **kwargs)
+    install_query_timing(timed_engine)
+    return timed_engine
 
 # Dependency
 def get_db():
@@ -55,12 +248,62 @@ def get_db_conn() -> Database:
         return _db_conn
 
 
+def get_replica_router() -> ReplicaRouter:
+    assert _replica_router != None, "The replica router is None"
+    return _replica_router
 
-# This is the part that replaces sessionmaker
-def get_db_sess(db_conn=Depends(get_db_conn)) -> Iterable[Session]:
+
+def get_request_write_lsn(request: Request) -> Optional[int]:
+    """The write position the client sent back, from the X-Write-LSN header
+    or the write_lsn cookie. Malformed values are ignored."""
+
+    position = request.headers.get(WRITE_POSITION_HEADER) or request.cookies.get(WRITE_POSITION_COOKIE)
+    try:
+        return parse_lsn(position)
+    except ValueError:
+        return None
+
+
+def _session_scope(
+    db_conn: Database,
+    request: Request,
+    records_write: bool,
+    read_after_write: bool = False,
+) -> Iterable[Session]:
     sess = Session(bind=db_conn)
+    # tells the service layer not to share this read through the page cache
+    sess.info["read_after_write"] = read_after_write
 
     try:
         yield sess
     finally:
-        sess.close()
\ No newline at end of file
+        sess.close()
+        if records_write:
+            # picked up by the write position middleware in main
+            request.state.write_position = get_replica_router().current_write_position()
+
+
+# This is the part that replaces sessionmaker
+def get_db_sess(request: Request, db_conn=Depends(get_db_conn)) -> Iterable[Session]:
+    yield from _session_scope(db_conn, request, records_write=request.method != "GET")
+
+
+def get_read_db_sess(request: Request, router: ReplicaRouter = Depends(get_replica_router)) -> Iterable[Session]:
+    db_conn, read_after_write = router.route_read(get_request_write_lsn(request))
+    yield from _session_scope(
+        db_conn, request, records_write=False, read_after_write=read_after_write
+    )
+
+
+def get_sql_db_sess(
+    request: Request,
+    sql_command: str,
+    router: ReplicaRouter = Depends(get_replica_router),
+) -> Iterable[Session]:
+    if is_read_only_sql(sql_command):
+        (db_conn, read_after_write), records_write = router.route_read(get_request_write_lsn(request)), False
+    else:
+        db_conn, read_after_write, records_write = router.primary, False, True
+    yield from _session_scope(
+        db_conn, request, records_write=records_write, read_after_write=read_after_write
+    )
@@ -3,8 +3,9 @@ from uuid import uuid4
 from sqlalchemy.orm import Session
 from fastapi import Depends
 from config import Settings
-from database import get_db_sess
-from services import DataBaseService
+from database import get_db_sess, get_read_db_sess, get_sql_db_sess
+from services import DataBaseService, JobService, RetentionService
+from jobs import JobManager, get_job_manager
 from service_results import get_settings
 
 def initiate_database_service(
@@ -12,3 +13,26 @@ def initiate_database_service(
     app_settings: Settings = Depends(get_settings),
 ):
     return DataBaseService(db=db, app_settings=app_settings)
+
+def initiate_read_database_service(
+    db: Session = Depends(get_read_db_sess),
+    app_settings: Settings = Depends(get_settings),
+):
+    return DataBaseService(db=db, app_settings=app_settings)
+
+def initiate_sql_database_service(
+    db: Session = Depends(get_sql_db_sess),
+    app_settings: Settings = Depends(get_settings),
+):
+    return DataBaseService(db=db, app_settings=app_settings)
+
+def initiate_job_service(
+    db: Session = Depends(get_db_sess),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    return JobService(db=db, job_manager=job_manager)
+
+def initiate_retention_service(
+    db: Session = Depends(get_db_sess),
+):
+    return RetentionService(db=db)
@@ -0,0 +1,417 @@
+import csv
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import case, create_engine, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from config import Settings
+from database import is_read_only_sql
+from models import QueryJob
+from query_cache import get_query_cache
+from requestSerialization import serialize_row
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+RESULT_FETCH_SIZE = 5000
+
+
+def job_to_dict(job: QueryJob):
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "sql_command": job.sql_command,
+        "export": job.export,
+        "submitted_at": job.submitted_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "rows_count": job.rows_count,
+        "error": job.error,
+        "export_ready": job.export and job.result_path is not None and job.status == JOB_SUCCEEDED,
+    }
+
+
+class JobManager:
+    """Runs long queries and exports on a bounded worker pool with its own
+    database engine, so they never hold request-serving threads or connections.
+
+    Job state lives in the `query_jobs` table and results are spilled to files
+    under `JOB_EXPORT_DIR`, which must be storage shared by every worker, so
+    any worker can answer status, result and cancel calls. A cancel only flags
+    the job; the worker running it notices the flag and cancels the query
+    through its own DBAPI connection.
+
+    Each worker heartbeats the jobs it owns. Jobs whose worker died without a
+    clean shutdown stop heartbeating, and any worker then marks them failed
+    (or cancelled, if a cancel was requested)."""
+
+    def __init__(self, app_settings: Settings) -> None:
+        self.app_settings = app_settings
+        self.max_workers = app_settings.job_workers
+        self.max_retained = app_settings.job_max_retained
+        self.export_dir = app_settings.job_export_dir
+        self.cancel_poll_seconds = app_settings.job_cancel_poll_seconds
+        self.heartbeat_timeout_seconds = app_settings.job_heartbeat_timeout_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        # DBAPI connections of the jobs running in this process, by job id
+        self._running: Dict[str, object] = {}
+        self._cancelled: Set[str] = set()
+        self._queued: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._table_ready = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._engine: Optional[Engine] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def start(self):
+        os.makedirs(self.export_dir, exist_ok=True)
+        # one extra connection for the watcher
+        self._engine = create_engine(
+            self.app_settings.get_full_db_url(),
+            pool_size=self.max_workers + 1,
+            max_overflow=0,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="db-job"
+        )
+        self._watcher = threading.Thread(
+            target=self._watch, name="db-job-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def shutdown(self):
+        self._stop_event.set()
+        with self._lock:
+            running = list(self._running)
+            queued = list(self._queued)
+        for job_id in running:
+            self._cancel_local(job_id)
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._engine:
+            if queued:
+                try:
+                    with self._engine.begin() as connection:
+                        connection.execute(
+                            update(QueryJob)
+                            .where(QueryJob.job_id.in_(queued), QueryJob.status == JOB_PENDING)
+                            .values(status=JOB_FAILED, error="Worker shut down", finished_at=time.time())
+                        )
+                except Exception:
+                    logger.exception("Could not mark queued jobs as failed")
+            self._engine.dispose()
+
+    def submit(self, db: Session, sql_command: str, export: bool = False):
+        if not sql_command.strip():
+            raise ValueError("SQL command cannot be empty")
+
+        self._ensure_table(db)
+        job = QueryJob(
+            job_id=str(uuid4()),
+            status=JOB_PENDING,
+            sql_command=sql_command,
+            export=export,
+            submitted_at=time.time(),
+            rows_count=0,
+            cancel_requested=False,
+            worker_id=self.worker_id,
+            heartbeat_at=time.time(),
+        )
+        with db.begin():
+            db.add(job)
+            job_dict = job_to_dict(job)
+        self._evict_finished_jobs(db)
+
+        # job is expired by the commit, reading it again would start a transaction
+        with self._lock:
+            self._queued.add(job_dict["job_id"])
+        self._executor.submit(self._run, job_dict["job_id"])
+        return job_dict
+
+    def get_job(self, db: Session, job_id: str):
+        return job_to_dict(self._get(db, job_id))
+
+    def cancel(self, db: Session, job_id: str):
+        self._ensure_table(db)
+        with db.begin():
+            job = db.get(QueryJob, job_id, with_for_update=True)
+            if job is None:
+                raise ValueError(f"Job '{job_id}' does not exist")
+            if job.status in FINISHED_STATES:
+                raise ValueError(f"Job '{job_id}' already {job.status}")
+
+            job.cancel_requested = True
+            if job.status == JOB_PENDING:
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+            job_dict = job_to_dict(job)
+
+        # if the job runs in this process cancel it now, otherwise its worker's
+        # watcher picks the flag up within `cancel_poll_seconds`, or, if that
+        # worker is gone, the job is cancelled once its heartbeat goes stale
+        self._cancel_local(job_id)
+        return job_dict
+
+    def get_result_page(self, db: Session, job_id: str, skip: int = 0, limit: int = 100):
+        job = self._get(db, job_id)
+        if job.status != JOB_SUCCEEDED:
+            raise ValueError(f"Job '{job_id}' is {job.status}, results are not available")
+        if job.export:
+            raise ValueError(f"Job '{job_id}' is an export, download the file instead")
+
+        rows = []
+        if job.result_path is not None:
+            with open(self._existing_path(job), "r") as result_file:
+                rows = [json.loads(line) for line in itertools.islice(result_file, skip, skip + limit)]
+
+        return {
+            "job_id": job.job_id,
+            "rows": rows,
+            "rows_count": job.rows_count,
+            "skip": skip,
+            "limit": limit,
+        }
+
+    def get_export_path(self, db: Session, job_id: str) -> str:
+        job = self._get(db, job_id)
+        if not job.export:
+            raise ValueError(f"Job '{job_id}' is not an export")
+        if job.status != JOB_SUCCEEDED or job.result_path is None:
+            raise ValueError(f"Job '{job_id}' is {job.status}, export is not available")
+        return self._existing_path(job)
+
+    def _get(self, db: Session, job_id: str) -> QueryJob:
+        self._ensure_table(db)
+        with db.begin():
+            job = db.get(QueryJob, job_id)
+            if job is None:
+                raise ValueError(f"Job '{job_id}' does not exist")
+            db.expunge(job)
+        return job
+
+    def _existing_path(self, job: QueryJob) -> str:
+        if not os.path.exists(job.result_path):
+            raise ValueError(
+                f"Result file of job '{job.job_id}' is missing, JOB_EXPORT_DIR must be shared by all workers"
+            )
+        return job.result_path
+
+    def _ensure_table(self, db: Session):
+        if not self._table_ready:
+            QueryJob.__table__.create(db.bind, checkfirst=True)
+            self._table_ready = True
+
+    def _run(self, job_id: str):
+        with self._lock:
+            self._queued.discard(job_id)
+        try:
+            with self._engine.begin() as connection:
+                claimed = connection.execute(
+                    update(QueryJob)
+                    .where(QueryJob.job_id == job_id, QueryJob.status == JOB_PENDING)
+                    .values(status=JOB_RUNNING, started_at=time.time(), heartbeat_at=time.time())
+                    .returning(QueryJob.sql_command, QueryJob.export)
+                ).first()
+            if claimed is None:
+                # cancelled while it was queued
+                return
+            sql_command, export = claimed
+
+            with self._engine.connect() as connection:
+                with self._lock:
+                    self._running[job_id] = connection.connection.dbapi_connection
+                try:
+                    rows_count, result_path = self._execute(connection, job_id, sql_command, export)
+                    connection.commit()
+                finally:
+                    # unregister before the connection goes back to the pool so
+                    # a late cancel can never reach another job's query
+                    with self._lock:
+                        self._running.pop(job_id, None)
+
+            if not is_read_only_sql(sql_command):
+                get_query_cache().invalidate_all()
+            self._finish(job_id, JOB_SUCCEEDED, rows_count=rows_count, result_path=result_path)
+        except DBAPIError as raised_exception:
+            self._finish(job_id, JOB_FAILED, error=str(raised_exception.orig))
+        except Exception as raised_exception:
+            self._finish(job_id, JOB_FAILED, error=str(raised_exception))
+
+    def _execute(self, connection, job_id: str, sql_command: str, export: bool):
+        # psycopg2 streams through a named cursor (DECLARE ... CURSOR FOR), which
+        # only accepts queries, so writes run on a normal cursor
+        if is_read_only_sql(sql_command):
+            connection = connection.execution_options(stream_results=True, yield_per=RESULT_FETCH_SIZE)
+        result = connection.execute(text(sql_command))
+        if not result.returns_rows:
+            if export:
+                raise ValueError("Export query must return rows")
+            return result.rowcount, None
+
+        result_path = os.path.join(self.export_dir, f"{job_id}.{'csv' if export else 'jsonl'}")
+        rows_count = 0
+        try:
+            with open(result_path, "w", newline="") as result_file:
+                columns = list(result.keys())
+                if export:
+                    writer = csv.writer(result_file)
+                    writer.writerow(columns)
+                for partition in result.partitions(RESULT_FETCH_SIZE):
+                    if job_id in self._cancelled:
+                        raise ValueError("Job cancelled")
+                    rows = [serialize_row(dict(zip(columns, row))) for row in partition]
+                    if export:
+                        writer.writerows(row.values() for row in rows)
+                    else:
+                        result_file.writelines(json.dumps(jsonable_encoder(row)) + "\n" for row in rows)
+                    rows_count += len(rows)
+        except Exception:
+            if os.path.exists(result_path):
+                os.remove(result_path)
+            raise
+        return rows_count, result_path
+
+    def _finish(
+        self,
+        job_id: str,
+        status: str,
+        error: Optional[str] = None,
+        rows_count: int = 0,
+        result_path: Optional[str] = None,
+    ):
+        with self._lock:
+            cancelled_here = job_id in self._cancelled
+            self._cancelled.discard(job_id)
+        if status == JOB_FAILED and cancelled_here:
+            status, error = JOB_CANCELLED, None
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(
+                    update(QueryJob)
+                    .where(QueryJob.job_id == job_id)
+                    .values(
+                        status=status,
+                        error=error,
+                        rows_count=rows_count,
+                        result_path=result_path,
+                        finished_at=time.time(),
+                    )
+                )
+                if status == JOB_FAILED:
+                    # failures caused by a cancel flagged from another worker
+                    connection.execute(
+                        update(QueryJob)
+                        .where(QueryJob.job_id == job_id, QueryJob.cancel_requested.is_(True))
+                        .values(status=JOB_CANCELLED, error=None)
+                    )
+        except Exception:
+            logger.exception("Could not record the result of job '%s'", job_id)
+
+    def _cancel_local(self, job_id: str):
+        with self._lock:
+            dbapi_connection = self._running.get(job_id)
+            if dbapi_connection is None:
+                return
+            self._cancelled.add(job_id)
+            dbapi_connection.cancel()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.cancel_poll_seconds):
+            with self._lock:
+                running = list(self._running)
+                owned = running + list(self._queued)
+            try:
+                with self._engine.begin() as connection:
+                    self._heartbeat(connection, owned)
+                    self._fail_abandoned_jobs(connection)
+                    flagged = connection.execute(
+                        select(QueryJob.job_id)
+                        .where(QueryJob.job_id.in_(running), QueryJob.cancel_requested.is_(True))
+                    ).scalars().all() if running else []
+                for job_id in flagged:
+                    self._cancel_local(job_id)
+            except Exception:
+                logger.exception("Job watcher check failed")
+
+    def _heartbeat(self, connection, job_ids):
+        if job_ids:
+            connection.execute(
+                update(QueryJob)
+                .where(QueryJob.job_id.in_(job_ids), QueryJob.status.in_((JOB_PENDING, JOB_RUNNING)))
+                .values(worker_id=self.worker_id, heartbeat_at=time.time())
+            )
+
+    def _fail_abandoned_jobs(self, connection):
+        """Finishes the unfinished jobs whose worker stopped heartbeating."""
+
+        abandoned = connection.execute(
+            update(QueryJob)
+            .where(
+                QueryJob.status.in_((JOB_PENDING, JOB_RUNNING)),
+                QueryJob.heartbeat_at < time.time() - self.heartbeat_timeout_seconds,
+            )
+            .values(
+                status=case((QueryJob.cancel_requested.is_(True), JOB_CANCELLED), else_=JOB_FAILED),
+                error=case((QueryJob.cancel_requested.is_(True), None), else_="Worker running the job stopped"),
+                finished_at=time.time(),
+            )
+            .returning(QueryJob.job_id, QueryJob.worker_id)
+        ).all()
+        for job_id, worker_id in abandoned:
+            logger.warning("Job '%s' abandoned by worker '%s'", job_id, worker_id)
+
+    def _evict_finished_jobs(self, db: Session):
+        """Drops the oldest finished jobs (and their result files) beyond the
+        newest `max_retained` ones."""
+
+        with db.begin():
+            stale_jobs = (
+                db.query(QueryJob)
+                .filter(QueryJob.status.in_(FINISHED_STATES))
+                .order_by(QueryJob.submitted_at.desc())
+                .offset(self.max_retained)
+                .all()
+            )
+            for job in stale_jobs:
+                if job.result_path and os.path.exists(job.result_path):
+                    os.remove(job.result_path)
+                db.delete(job)
+
+
+_job_manager: Optional[JobManager] = None
+
+def open_job_manager(app_settings: Settings):
+    global _job_manager
+    _job_manager = JobManager(app_settings=app_settings)
+    _job_manager.start()
+
+
+def close_job_manager():
+    global _job_manager
+    if _job_manager:
+        _job_manager.shutdown()
+
+
+def get_job_manager() -> JobManager:
+    assert _job_manager != None, "The job manager is None"
+    return _job_manager
@@ -1,24 +1,53 @@
 from contextlib import asynccontextmanager
-from database import engine, open_db_connections, close_db_connections
-from fastapi import FastAPI, APIRouter, Depends, Query
+from database import engine, open_db_connections, close_db_connections, get_db_conn, WRITE_POSITION_HEADER, WRITE_POSITION_COOKIE
+from fastapi import FastAPI, APIRouter, Depends, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from schemas import TableCreateOut, TableSchema, TableDataOut, TableDataIn, DeleteResponse, SingleTableDataOut, TableDataUpdateIn
-from dependencies import initiate_database_service
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from schemas import TableCreateOut, TableSchema, TableDataOut, TableDataIn, DeleteResponse, SingleTableDataOut, TableDataUpdateIn, BatchIn, BatchOut, TableStatsOut, RetentionPolicyIn, RetentionPolicyOut, RetentionPoliciesOut, JobSubmitIn, JobOut, JobResultOut
+from dependencies import (
+    initiate_database_service,
+    initiate_read_database_service,
+    initiate_sql_database_service,
+    initiate_job_service,
+    initiate_retention_service,
+)
 from service_results import handle_result
-from services import DataBaseService
+from services import DataBaseService, JobService, RetentionService
+from jobs import open_job_manager, close_job_manager
+from retention import open_retention_scheduler, close_retention_scheduler
+from profiling import (
+    TimedJSONResponse,
+    start_request_timing,
+    format_server_timing,
+    sampling_profiler,
+)
+from exceptions import handle_bad_request_exception, handle_conflict_exception, handle_forbidden_exception, invalid_auth_credentials_exception
+from typing import Optional
+import math
+import time
 from models import Base
 from config import Settings
 from uuid import uuid4
+from crud import MAX_EXACT_COUNT_TIMEOUT_MS
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     ##open db connections
     open_db_connections()
+    open_job_manager(settings)
+    open_retention_scheduler(get_db_conn(), settings)
     yield
     ##close db connections
+    close_retention_scheduler()
+    close_job_manager()
     close_db_connections()
 
-app = FastAPI(lifespan=lifespan)
+settings = Settings()
+
+app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse if settings.server_timing_enabled else JSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,9 +55,36 @@ app.add_middleware(
     allow_methods = ["*"],
     allow_credentials= True,
     allow_headers=["*"],
+    expose_headers=[WRITE_POSITION_HEADER],
 )
- 
-settings = Settings()
+
+if settings.db_read_after_write_seconds and settings.db_replica_urls:
+    @app.middleware("http")
+    async def add_write_position(request: Request, call_next):
+        # hands the client the primary's position after its write; sent back
+        # (cookie or header) it keeps its reads off replicas that are behind it
+        response = await call_next(request)
+        write_position = getattr(request.state, "write_position", None)
+        if write_position:
+            response.headers[WRITE_POSITION_HEADER] = write_position
+            response.set_cookie(
+                WRITE_POSITION_COOKIE,
+                write_position,
+                max_age=math.ceil(settings.db_read_after_write_seconds),
+                httponly=True,
+                samesite="lax",
+            )
+        return response
+
+if settings.server_timing_enabled:
+    @app.middleware("http")
+    async def add_server_timing_header(request: Request, call_next):
+        started = time.perf_counter()
+        timings = start_request_timing()
+        response = await call_next(request)
+        timings["total"] = (time.perf_counter() - started) * 1000
+        response.headers["Server-Timing"] = format_server_timing(timings)
+        return response
 
 @app.get("/")
 def welcome():
@@ -60,7 +116,7 @@ async def insert_data(
 def get_table_data_id(
     table_name: str = Query(),
     data_id: str = Query(),
-    db_service: DataBaseService = Depends(initiate_database_service)
+    db_service: DataBaseService = Depends(initiate_read_database_service)
 ):
     result = db_service.get_data_by_id(
         table_name=table_name,
@@ -75,21 +131,37 @@ def get_table_data(
     limit: int = Query(default=100), 
     order_direction: str = Query(default="asc"), 
     order_by: str = Query(default='created_at'),
-    db_service: DataBaseService = Depends(initiate_database_service)
+    include_estimated_total: bool = Query(False, description="Adds an estimated total row count from table statistics."),
+    db_service: DataBaseService = Depends(initiate_read_database_service)
 ):
     result = db_service.get_datas(
         table_name=table_name,
         skip=skip,
         limit=limit,
         order_direction=order_direction,
-        order_by=order_by
+        order_by=order_by,
+        include_estimated_total=include_estimated_total
     )
     return handle_result(result, TableDataOut)
 
+@app.get("/get-table-stats", response_model=TableStatsOut)
+def get_table_stats(
+    table_name: str = Query(),
+    exact_count: bool = Query(False, description="Also runs an exact count(*), bounded by exact_count_timeout_ms."),
+    exact_count_timeout_ms: int = Query(default=5000, ge=1, le=MAX_EXACT_COUNT_TIMEOUT_MS),
+    db_service: DataBaseService = Depends(initiate_database_service)
+):
+    result = db_service.get_table_stats(
+        table_name=table_name,
+        exact_count=exact_count,
+        exact_count_timeout_ms=exact_count_timeout_ms
+    )
+    return handle_result(result, expected_schema=TableStatsOut)
+
 @app.get("/send-sql-command")
 def send_sql_command(
     sql_command: str,
-    db_service: DataBaseService = Depends(initiate_database_service)
+    db_service: DataBaseService = Depends(initiate_sql_database_service)
 ):
     result = db_service.send_raw_sql_command(sql_command=sql_command)
     return result
@@ -103,6 +175,14 @@ def update_table_data(
     result = db_service.update_data(data=data)
     return handle_result(result, expected_schema=SingleTableDataOut)
 
+@app.post("/execute-batch", response_model=BatchOut)
+def execute_batch(
+    data: BatchIn,
+    db_service: DataBaseService = Depends(initiate_database_service)
+):
+    result = db_service.execute_batch(data=data)
+    return handle_result(result, expected_schema=BatchOut)
+
 @app.delete("/delete-data", response_model=DeleteResponse)
 def delete_table_data(
     table_name: str,
@@ -121,4 +201,94 @@ def delete_table(
     db_service: DataBaseService = Depends(initiate_database_service)
 ):
     result = db_service.delete_table(table_name)
-    return handle_result(result, expected_schema=DeleteResponse)
\ No newline at end of file
+    return handle_result(result, expected_schema=DeleteResponse)
+
+@app.post("/set-retention-policy", response_model=RetentionPolicyOut)
+def set_retention_policy(
+    data: RetentionPolicyIn,
+    retention_service: RetentionService = Depends(initiate_retention_service)
+):
+    result = retention_service.set_retention_policy(data=data)
+    return handle_result(result, expected_schema=RetentionPolicyOut)
+
+@app.get("/get-retention-policies", response_model=RetentionPoliciesOut)
+def get_retention_policies(
+    retention_service: RetentionService = Depends(initiate_retention_service)
+):
+    result = retention_service.get_retention_policies()
+    return handle_result(result, expected_schema=RetentionPoliciesOut)
+
+@app.delete("/delete-retention-policy", response_model=DeleteResponse)
+def delete_retention_policy(
+    table_name: str = Query(),
+    retention_service: RetentionService = Depends(initiate_retention_service)
+):
+    result = retention_service.delete_retention_policy(table_name=table_name)
+    return handle_result(result, expected_schema=DeleteResponse)
+
+@app.post("/submit-job", response_model=JobOut)
+def submit_job(
+    data: JobSubmitIn,
+    job_service: JobService = Depends(initiate_job_service)
+):
+    result = job_service.submit_job(sql_command=data.sql_command, export=data.export)
+    return handle_result(result, expected_schema=JobOut)
+
+@app.get("/get-job", response_model=JobOut)
+def get_job(
+    job_id: str = Query(),
+    job_service: JobService = Depends(initiate_job_service)
+):
+    result = job_service.get_job(job_id=job_id)
+    return handle_result(result, expected_schema=JobOut)
+
+@app.post("/cancel-job", response_model=JobOut)
+def cancel_job(
+    job_id: str = Query(),
+    job_service: JobService = Depends(initiate_job_service)
+):
+    result = job_service.cancel_job(job_id=job_id)
+    return handle_result(result, expected_schema=JobOut)
+
+@app.get("/get-job-result", response_model=JobResultOut)
+def get_job_result(
+    job_id: str = Query(),
+    skip: int = Query(default=0),
+    limit: int = Query(default=100),
+    job_service: JobService = Depends(initiate_job_service)
+):
+    result = job_service.get_job_result(job_id=job_id, skip=skip, limit=limit)
+    return handle_result(result, expected_schema=JobResultOut)
+
+@app.get("/download-job-export")
+def download_job_export(
+    job_id: str = Query(),
+    job_service: JobService = Depends(initiate_job_service)
+):
+    result = job_service.get_job_export_path(job_id=job_id)
+    if not result.success:
+        handle_result(result)
+    return FileResponse(result.data, media_type="text/csv", filename=f"{job_id}.csv")
+
+@app.get("/profile-worker", response_class=PlainTextResponse)
+def profile_worker(
+    seconds: float = Query(default=10, gt=0),
+    interval_ms: float = Query(default=10, gt=0),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Samples every thread of the worker serving this request for `seconds`
+    and returns collapsed stacks, ready for flamegraph.pl or speedscope."""
+
+    if not settings.profiler_enabled:
+        handle_forbidden_exception(Exception("Profiler is disabled, set PROFILER_ENABLED=true"))
+    if settings.profiler_token and x_admin_token != settings.profiler_token:
+        raise invalid_auth_credentials_exception("X-Admin-Token")
+    if seconds > settings.profiler_max_seconds:
+        handle_bad_request_exception(
+            Exception(f"seconds must not exceed {settings.profiler_max_seconds}")
+        )
+
+    try:
+        return sampling_profiler.profile(seconds=seconds, interval_ms=interval_ms)
+    except RuntimeError as raised_exception:
+        handle_conflict_exception(raised_exception)
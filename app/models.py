@@ -1,2 +1,51 @@
+from sqlalchemy import Column, String, Integer, Boolean, BigInteger, Float, Text, func
 from database import Base
 
+
+class RetentionPolicy(Base):
+    __tablename__ = "retention_policies"
+
+    table_name = Column(String, primary_key=True)
+    keep_days = Column(Integer, nullable=False)
+    batch_size = Column(Integer, nullable=False, default=5000)
+    sleep_ms = Column(Integer, nullable=False, default=100)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(BigInteger(), server_default=func.extract('epoch', func.now()))
+    updated_at = Column(BigInteger(), server_default=func.extract('epoch', func.now()),
+                        onupdate=func.extract('epoch', func.now()))
+
+
+# Latest enforcement metrics of each retention policy, written by whichever
+# worker holds the table's purge lock so every worker reports the same numbers.
+class RetentionRun(Base):
+    __tablename__ = "retention_runs"
+
+    table_name = Column(String, primary_key=True)
+    running = Column(Boolean, nullable=False, default=False)
+    rows_deleted_total = Column(BigInteger, nullable=False, default=0)
+    last_run_started_at = Column(Float)
+    last_run_finished_at = Column(Float)
+    last_run_rows_deleted = Column(BigInteger, nullable=False, default=0)
+    last_run_batches = Column(Integer, nullable=False, default=0)
+    last_run_rows_per_second = Column(Float, nullable=False, default=0.0)
+    last_batch_duration_ms = Column(Float)
+    last_error = Column(Text)
+
+
+class QueryJob(Base):
+    __tablename__ = "query_jobs"
+
+    job_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    sql_command = Column(Text, nullable=False)
+    export = Column(Boolean, nullable=False, default=False)
+    submitted_at = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    rows_count = Column(BigInteger, nullable=False, default=0)
+    error = Column(Text)
+    result_path = Column(String)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    # worker process that owns the job and when it last confirmed it is alive
+    worker_id = Column(String)
+    heartbeat_at = Column(Float)
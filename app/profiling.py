@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# Per request phase durations in ms and the phases currently open. Only set
+# while the Server-Timing middleware is installed, so every hook below is a
+# no-op otherwise.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+_active_phases: ContextVar[Optional[List["timed_phase"]]] = ContextVar("active_phases", default=None)
+
+
+class timed_phase:
+    """Adds the time spent in the block to the current request's `name` phase.
+
+    Phases are exclusive: time spent in a phase opened inside this one (e.g.
+    `sql` or `pool` inside `reflect`) only counts for the inner phase, so the
+    phases of a request never add up to more than its total."""
+
+    __slots__ = ("name", "timings", "started", "nested")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _request_timings.get()
+        if self.timings is not None:
+            self.nested = 0.0
+            self.started = time.perf_counter()
+            _active_phases.get().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            elapsed = (time.perf_counter() - self.started) * 1000
+            phases = _active_phases.get()
+            if self in phases:
+                phases.remove(self)
+            if phases:
+                phases[-1].nested += elapsed
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed - self.nested
+            self.timings = None
+        return False
+
+
+def start_request_timing() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    _active_phases.set([])
+    return timings
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={duration:.2f}" for name, duration in timings.items())
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports the time spent waiting for (or opening) a connection."""
+
+    def connect(self):
+        with timed_phase("pool"):
+            return super().connect()
+
+
+def install_query_timing(engine: Engine):
+    """Reports the time `engine` spends executing SQL as the `sql` phase. The
+    open phase lives on the execution context, so a failed statement cannot
+    leave it behind on the pooled connection."""
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _request_timings.get() is not None:
+        context._timed_sql_phase = timed_phase("sql").__enter__()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_sql_phase(context)
+
+
+def _handle_error(exception_context):
+    _finish_sql_phase(exception_context.execution_context)
+
+
+def _finish_sql_phase(context):
+    phase = getattr(context, "_timed_sql_phase", None)
+    if phase is not None:
+        context._timed_sql_phase = None
+        phase.__exit__(None, None, None)
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with timed_phase("encode"):
+            return super().render(content)
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread in this worker at a fixed interval
+    and aggregates them as collapsed stacks ("frame;frame;frame count"), the
+    input format of flamegraph.pl and speedscope. Nothing runs between
+    profiles."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval_ms: float) -> str:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running on this worker")
+        try:
+            stacks: Counter = Counter()
+            caller_ident = threading.get_ident()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(stacks, seconds, interval_ms / 1000, caller_ident),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            sampler.start()
+            sampler.join()
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+    def _sample(self, stacks: Counter, seconds: float, interval: float, caller_ident: int):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_ident, frame in sys._current_frames().items():
+                if thread_ident in (own_ident, caller_ident):
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_ident, str(thread_ident)))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(interval)
+
+
+sampling_profiler = SamplingProfiler()
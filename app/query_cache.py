@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from service_results import get_settings
+
+
+class _Flight:
+    """A query being loaded; concurrent callers for the same key wait on it."""
+
+    def __init__(self, generation: Tuple[int, int]) -> None:
+        self.generation = generation
+        self.event = threading.Event()
+        self.value: Any = None
+        self.exception: Optional[Exception] = None
+
+
+class QueryResultCache:
+    """Short lived, size bounded cache for page queries.
+
+    Identical concurrent misses are coalesced so only one query reaches the
+    database. Each table has a generation counter bumped on invalidation, so a
+    load that started before a write is handed to its waiters but never stored.
+    The cache is per process: other workers only see a write once their entries
+    expire, which is what the short TTL is for."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_rows: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._table_generations: Dict[str, int] = {}
+        self._global_generation = 0
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get_or_load(
+        self,
+        table_name: str,
+        key: Hashable,
+        loader: Callable[[], Any],
+        row_count: Callable[[Any], int] = lambda value: 1,
+    ) -> Any:
+        if not self.enabled:
+            return loader()
+
+        key = (table_name, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[2]
+
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight(self._generation(table_name))
+                self._inflight[key] = flight
+
+        if not is_leader:
+            flight.event.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as raised_exception:
+            flight.exception = raised_exception
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.exception is None and flight.generation == self._generation(table_name):
+                    self._store(key, flight.value, row_count(flight.value))
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, table_name: str):
+        with self._lock:
+            self._table_generations[table_name] = self._table_generations.get(table_name, 0) + 1
+            for key in [key for key in self._entries if key[0] == table_name]:
+                self._remove(key)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._global_generation += 1
+            self._entries.clear()
+            self._rows = 0
+
+    def _generation(self, table_name: str) -> Tuple[int, int]:
+        return self._global_generation, self._table_generations.get(table_name, 0)
+
+    def _store(self, key: Hashable, value: Any, rows: int):
+        if rows > self.max_rows:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, rows, value)
+        self._rows += rows
+        while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        _, rows, _ = self._entries.pop(key)
+        self._rows -= rows
+
+
+@lru_cache()
+def get_query_cache() -> QueryResultCache:
+    settings = get_settings()
+    return QueryResultCache(
+        ttl_seconds=settings.query_cache_ttl_seconds,
+        max_entries=settings.query_cache_max_entries,
+        max_rows=settings.query_cache_max_rows,
+    )
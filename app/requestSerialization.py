@@ -0,0 +1,80 @@
+import base64
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import Table
+from sqlalchemy.types import (
+    Float,
+    Integer,
+    LargeBinary,
+    Numeric,
+    Uuid,
+)
+
+
+def bind_value(column_type, value: Any) -> Any:
+    """Coerces a JSON decoded value into the python type the column expects,
+    so precision is kept (numeric) and text input is accepted for uuids and
+    base64 encoded bytea. Timestamp and date strings are passed through for
+    postgres to parse, it accepts more formats than python does."""
+
+    if value is None:
+        return None
+
+    if isinstance(column_type, Float):
+        return float(value)
+    if isinstance(column_type, Numeric):
+        # str() first so a float like 1.1 does not become 1.100000000000000088...
+        return value if isinstance(value, Decimal) else Decimal(str(value))
+    if isinstance(column_type, Integer):
+        return int(value) if isinstance(value, str) else value
+    if isinstance(column_type, Uuid):
+        return UUID(value) if isinstance(value, str) else value
+    if isinstance(column_type, LargeBinary):
+        return base64.b64decode(value, validate=True) if isinstance(value, str) else value
+    return value
+
+
+def bind_row(table: Table, data: Dict) -> Dict:
+    bound = {}
+    for key, value in data.items():
+        if key not in table.c:
+            bound[key] = value
+            continue
+        try:
+            bound[key] = bind_value(table.c[key].type, value)
+        except (ArithmeticError, TypeError, ValueError) as raised_exception:
+            raise ValueError(
+                f"Invalid value for column '{key}' of type {table.c[key].type}: {value!r}"
+            ) from raised_exception
+    return bound
+
+
+def precise_numeric_columns(table: Table):
+    """Names of the columns declared numeric(p,s); only their values are
+    returned as strings, other numerics keep their JSON number encoding."""
+
+    return {
+        column.name for column in table.columns
+        if isinstance(column.type, Numeric)
+        and not isinstance(column.type, Float)
+        and column.type.precision is not None
+    }
+
+
+def serialize_value(value: Any, precise: bool = False) -> Any:
+    """Converts database values that JSON encoding would mangle: numerics of
+    numeric(p,s) columns become strings (no float rounding) and bytea
+    becomes base64."""
+
+    if precise and isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    return value
+
+
+def serialize_row(row: Dict, table: Optional[Table] = None) -> Dict:
+    precise_columns = precise_numeric_columns(table) if table is not None else set()
+    return {key: serialize_value(value, key in precise_columns) for key, value in row.items()}
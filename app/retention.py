@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import MetaData, Table, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.types import DateTime
+
+from config import Settings
+from models import RetentionPolicy, RetentionRun
+from query_cache import get_query_cache
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# Keyset walk over created_at: each batch starts at the newest created_at the
+# previous batch deleted, so the index scan never re-reads the dead entries
+# left behind by earlier batches. SKIP LOCKED keeps purges out of ingest's way.
+PURGE_BATCH_QUERY = """
+    DELETE FROM "{table_name}"
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM "{table_name}"
+        WHERE created_at < :cutoff {keyset_condition}
+        ORDER BY created_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ))
+    RETURNING created_at
+"""
+
+# NULL when the index does not exist, false when a concurrent build failed
+INDEX_VALID_QUERY = text("""
+    SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index_name)
+""")
+
+
+class RetentionScheduler:
+    """Background thread that periodically enforces the retention policies
+    stored in `retention_policies`, deleting expired rows in small batches.
+
+    Only the worker holding a table's advisory lock purges it; that worker
+    also builds the created_at index and records the run's metrics in
+    `retention_runs`, so they are shared by every worker."""
+
+    def __init__(self, engine: Engine, interval_seconds: float) -> None:
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._indexed_tables = set()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="retention-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                RetentionPolicy.__table__.create(self.engine, checkfirst=True)
+                RetentionRun.__table__.create(self.engine, checkfirst=True)
+                with Session(bind=self.engine) as sess:
+                    policies = [
+                        (policy.table_name, policy.keep_days, policy.batch_size, policy.sleep_ms)
+                        for policy in sess.query(RetentionPolicy).filter(RetentionPolicy.enabled.is_(True))
+                    ]
+                for table_name, keep_days, batch_size, sleep_ms in policies:
+                    if self._stop_event.is_set():
+                        break
+                    self.enforce(table_name, keep_days, batch_size, sleep_ms)
+            except Exception:
+                logger.exception("Retention run failed")
+            self._stop_event.wait(self.interval_seconds)
+
+    def enforce(self, table_name: str, keep_days: int, batch_size: int, sleep_ms: int):
+        with self.engine.connect() as connection:
+            # only one worker process purges a given table at a time
+            lock_key = f"retention:{table_name}"
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": lock_key}
+            ).scalar()
+            connection.commit()
+            if not locked:
+                logger.debug("Skipping retention for '%s', another worker is purging it", table_name)
+                return
+            try:
+                self._purge(connection, table_name, keep_days, batch_size, sleep_ms)
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": lock_key}
+                )
+                connection.commit()
+
+    def _purge(self, connection, table_name: str, keep_days: int, batch_size: int, sleep_ms: int):
+        with connection.begin():
+            rows_deleted_total = connection.execute(
+                select(RetentionRun.rows_deleted_total).where(RetentionRun.table_name == table_name)
+            ).scalar()
+            metrics = {
+                "running": True,
+                "rows_deleted_total": rows_deleted_total or 0,
+                "last_run_started_at": time.time(),
+                "last_run_finished_at": None,
+                "last_run_rows_deleted": 0,
+                "last_run_batches": 0,
+                "last_run_rows_per_second": 0.0,
+                "last_error": None,
+            }
+            self._save_metrics(connection, table_name, metrics)
+
+        started = time.monotonic()
+        try:
+            table = Table(table_name, MetaData(), autoload_with=self.engine)
+            if "created_at" not in table.c:
+                raise ValueError(f"Table '{table_name}' has no created_at column")
+            self._ensure_created_at_index(table_name)
+
+            first_batch_query = text(PURGE_BATCH_QUERY.format(table_name=table_name, keyset_condition=""))
+            next_batch_query = text(PURGE_BATCH_QUERY.format(
+                table_name=table_name, keyset_condition="AND created_at >= :lower_bound"
+            ))
+            now = connection.execute(text("SELECT now()")).scalar()
+            connection.commit()
+            if isinstance(table.c.created_at.type, DateTime):
+                cutoff = now - timedelta(days=keep_days)
+            else:
+                cutoff = int(now.timestamp()) - keep_days * SECONDS_PER_DAY
+            lower_bound = None
+
+            while not self._stop_event.is_set():
+                batch_started = time.monotonic()
+                with connection.begin():
+                    params = {"cutoff": cutoff, "batch_size": batch_size}
+                    if lower_bound is not None:
+                        params["lower_bound"] = lower_bound
+                    deleted = connection.execute(
+                        first_batch_query if lower_bound is None else next_batch_query,
+                        params,
+                    ).scalars().all()
+
+                    metrics["last_run_batches"] += 1
+                    metrics["last_run_rows_deleted"] += len(deleted)
+                    metrics["rows_deleted_total"] += len(deleted)
+                    metrics["last_batch_duration_ms"] = (time.monotonic() - batch_started) * 1000
+                    metrics["last_run_rows_per_second"] = (
+                        metrics["last_run_rows_deleted"] / max(time.monotonic() - started, 1e-6)
+                    )
+                    # committed with the batch, so the totals never count rolled back rows
+                    self._save_metrics(connection, table_name, metrics)
+                if deleted:
+                    lower_bound = max(deleted)
+                    get_query_cache().invalidate(table_name)
+
+                if len(deleted) < batch_size:
+                    break
+                self._stop_event.wait(sleep_ms / 1000)
+        except Exception as raised_exception:
+            metrics["last_error"] = str(raised_exception)
+            logger.exception("Retention for '%s' failed", table_name)
+        finally:
+            metrics["running"] = False
+            metrics["last_run_finished_at"] = time.time()
+            try:
+                connection.rollback()
+                with connection.begin():
+                    self._save_metrics(connection, table_name, metrics)
+            except Exception:
+                logger.exception("Could not record the retention run of '%s'", table_name)
+
+    def _save_metrics(self, connection, table_name: str, metrics: Dict):
+        connection.execute(
+            insert(RetentionRun)
+            .values(table_name=table_name, **metrics)
+            .on_conflict_do_update(index_elements=[RetentionRun.table_name], set_=metrics)
+        )
+
+    def _ensure_created_at_index(self, table_name: str):
+        """The batches walk created_at, which the generated column does not
+        index, so build the index once without blocking writes. Called under
+        the table's purge lock so only one worker builds it. A failed
+        concurrent build leaves an invalid index behind that IF NOT EXISTS
+        would keep skipping, so it is dropped and built again."""
+
+        if table_name in self._indexed_tables:
+            return
+        index_name = f"ix_{table_name}_created_at"
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            is_valid = connection.execute(
+                INDEX_VALID_QUERY, {"index_name": f'"{index_name}"'}
+            ).scalar()
+            if is_valid is False:
+                logger.warning("Rebuilding invalid index '%s'", index_name)
+                connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'))
+            if not is_valid:
+                connection.execute(text(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" '
+                    f'ON "{table_name}" (created_at)'
+                ))
+        self._indexed_tables.add(table_name)
+
+
+_retention_scheduler: Optional[RetentionScheduler] = None
+
+def open_retention_scheduler(engine: Engine, app_settings: Settings):
+    global _retention_scheduler
+    _retention_scheduler = RetentionScheduler(
+        engine=engine, interval_seconds=app_settings.retention_interval_seconds
+    )
+    if app_settings.retention_enabled:
+        _retention_scheduler.start()
+
+
+def close_retention_scheduler():
+    global _retention_scheduler
+    if _retention_scheduler:
+        _retention_scheduler.stop()
+
+
+def get_retention_scheduler() -> RetentionScheduler:
+    assert _retention_scheduler != None, "The retention scheduler is None"
+    return _retention_scheduler
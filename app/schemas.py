@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
+from datetime import datetime
 
 class ColumnDefinition(BaseModel):
     name: str
@@ -29,6 +30,90 @@ class SingleTableDataOut(BaseModel):
 
 class TableDataOut(BaseModel):
     data: List[Dict]
+    estimated_total: Optional[int] = None
+
+class TableStatsOut(BaseModel):
+    table_name: str
+    estimated_row_count: int
+    live_tuples: Optional[int] = None
+    dead_tuples: Optional[int] = None
+    table_size_bytes: int
+    indexes_size_bytes: int
+    total_size_bytes: int
+    last_vacuum: Optional[datetime] = None
+    last_autovacuum: Optional[datetime] = None
+    last_analyze: Optional[datetime] = None
+    last_autoanalyze: Optional[datetime] = None
+    exact_row_count: Optional[int] = None
+    exact_count_timed_out: bool = False
 
 class DeleteResponse(BaseModel):
-    detail: str
\ No newline at end of file
+    detail: str
+
+class BatchOperation(BaseModel):
+    operation: str
+    table_name: str
+    id: Optional[int] = None
+    data: Dict = {}
+
+class BatchIn(BaseModel):
+    operations: List[BatchOperation]
+
+class BatchOperationResult(BaseModel):
+    index: int
+    operation: str
+    table_name: str
+    rows_affected: int
+    data: Optional[Dict] = None
+
+class BatchOut(BaseModel):
+    results: List[BatchOperationResult]
+
+class RetentionPolicyIn(BaseModel):
+    table_name: str
+    keep_days: int
+    batch_size: int = 5000
+    sleep_ms: int = 100
+    enabled: bool = True
+
+class RetentionPolicyOut(BaseModel):
+    table_name: str
+    keep_days: int
+    batch_size: int
+    sleep_ms: int
+    enabled: bool
+    running: bool = False
+    rows_deleted_total: int = 0
+    last_run_started_at: Optional[float] = None
+    last_run_finished_at: Optional[float] = None
+    last_run_rows_deleted: int = 0
+    last_run_batches: int = 0
+    last_run_rows_per_second: float = 0.0
+    last_batch_duration_ms: Optional[float] = None
+    last_error: Optional[str] = None
+
+class RetentionPoliciesOut(BaseModel):
+    policies: List[RetentionPolicyOut]
+
+class JobSubmitIn(BaseModel):
+    sql_command: str
+    export: bool = False
+
+class JobOut(BaseModel):
+    job_id: str
+    status: str
+    sql_command: str
+    export: bool
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    rows_count: int
+    error: Optional[str] = None
+    export_ready: bool
+
+class JobResultOut(BaseModel):
+    job_id: str
+    rows: List[Dict]
+    rows_count: int
+    skip: int
+    limit: int
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from config import Settings
+from profiling import timed_phase
 from exceptions import (
     GeneralException,
     handle_bad_request_exception,
@@ -54,10 +55,11 @@ def handle_result(result: ServiceResult, expected_schema: BaseModel = None):  #
 
     if result.success:
         try:
-            if expected_schema is not None:
-                return expected_schema.model_validate(result.data)
-            else:
-                return AppResponseModel(detail=result.data)
+            with timed_phase("validate"):
+                if expected_schema is not None:
+                    return expected_schema.model_validate(result.data)
+                else:
+                    return AppResponseModel(detail=result.data)
         except Exception as raised_exception:
             handle_bad_request_exception(raised_exception)
 
@@ -11,9 +11,20 @@ from schemas import (
     TableDataOut, 
     DeleteResponse,
     TableDataUpdateIn, 
-    SingleTableDataOut)
+    SingleTableDataOut,
+    BatchIn,
+    BatchOut,
+    TableStatsOut,
+    RetentionPolicyIn,
+    RetentionPolicyOut,
+    RetentionPoliciesOut,
+    JobOut,
+    JobResultOut)
 
 from crud import DataBaseCrud
+from database import is_read_only_sql
+from query_cache import get_query_cache
+from jobs import JobManager
 from service_results import ServiceResult, success_service_result, failed_service_result
 
 class DataBaseService:
@@ -24,6 +35,7 @@ class DataBaseService:
     ) -> None:
         self.crud = DataBaseCrud(db=db)
         self.app_settings = app_settings
+        self.query_cache = get_query_cache()
         
     def create_table(
         self,
@@ -51,6 +63,7 @@ class DataBaseService:
     )->Union[ServiceResult, Exception]:
         try:
             result = self.crud.insert_data(table_name=data.table_name, data=data.data)
+            self.query_cache.invalidate(data.table_name)
 
             return success_service_result(TableDataOut.model_validate(result))
         except Exception as raised_exception:
@@ -62,25 +75,63 @@ class DataBaseService:
         skip: int = 0, 
         limit: int = 100, 
         order_direction: str = 'asc', 
-        order_by: str = 'created_at'
+        order_by: str = 'created_at',
+        include_estimated_total: bool = False
     )->Union[ServiceResult, Exception]:
         try:
-            result = self.crud.get_table_datas(
+            load_datas = lambda: self._load_datas(
                 table_name=table_name,
                 skip=skip,
                 limit=limit,
                 order_direction=order_direction,
-                order_by=order_by
+                order_by=order_by,
+                include_estimated_total=include_estimated_total
             )
-            
-            data = {
-                "data":result
-            }
+            # a client reading after its own write must never get a page
+            # loaded before that write, which other workers may still hold
+            if self.crud.db.info.get("read_after_write"):
+                return success_service_result(load_datas())
 
-            return success_service_result(TableDataOut.model_validate(data))
+            # pages are keyed by the engine that served them, primary and
+            # each replica can be at a different point in time
+            cache_key = (
+                str(self.crud.db.bind.url), skip, limit, order_direction.lower(), order_by, include_estimated_total
+            )
+            result = self.query_cache.get_or_load(
+                table_name,
+                cache_key,
+                load_datas,
+                row_count=lambda page: len(page.data),
+            )
+            return success_service_result(result)
         except Exception as raised_exception:
             return failed_service_result(raised_exception)
 
+    def _load_datas(
+        self,
+        table_name: str,
+        skip: int,
+        limit: int,
+        order_direction: str,
+        order_by: str,
+        include_estimated_total: bool
+    )->TableDataOut:
+        result = self.crud.get_table_datas(
+            table_name=table_name,
+            skip=skip,
+            limit=limit,
+            order_direction=order_direction,
+            order_by=order_by
+        )
+        
+        data = {
+            "data":result
+        }
+        if include_estimated_total:
+            data["estimated_total"] = self.crud.get_estimated_row_count(table_name)
+
+        return TableDataOut.model_validate(data)
+
     def get_data_by_id(
         self,
         table_name,
@@ -107,6 +158,7 @@ class DataBaseService:
                 id=data.id,
                 data=data.data
             )
+            self.query_cache.invalidate(data.table_name)
             data = {
                 'data':result
             }
@@ -124,6 +176,7 @@ class DataBaseService:
                 table_name=table_name,
                 record_id=data_id
             )
+            self.query_cache.invalidate(table_name)
             result = {
                 "detail":f"Deleted {result} row with id: {data_id}"
             }
@@ -137,16 +190,152 @@ class DataBaseService:
     )->Union[ServiceResult, Exception]:
         try:
             result = self.crud.drop_table_by_name(table_name=table_name)
+            self.query_cache.invalidate(table_name)
             return success_service_result(DeleteResponse.model_validate(result))
         except Exception as raised_exception:
             return failed_service_result(raised_exception)
     
+    def execute_batch(
+        self,
+        data: BatchIn
+    )->Union[ServiceResult, Exception]:
+        try:
+            result = self.crud.execute_batch(operations=data.operations)
+            for table_name in {operation.table_name for operation in data.operations}:
+                self.query_cache.invalidate(table_name)
+            return success_service_result(BatchOut.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def get_table_stats(
+        self,
+        table_name: str,
+        exact_count: bool = False,
+        exact_count_timeout_ms: int = 5000
+    )->Union[ServiceResult, Exception]:
+        try:
+            result = self.crud.get_table_stats(
+                table_name=table_name,
+                exact_count=exact_count,
+                exact_count_timeout_ms=exact_count_timeout_ms
+            )
+            return success_service_result(TableStatsOut.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
     def send_raw_sql_command(
         self,
         sql_command: str
     ):
         try:
             result = self.crud.send_raw_sql_command(sql_command)
+            if not is_read_only_sql(sql_command):
+                self.query_cache.invalidate_all()
             return result
         except Exception as raised_exception:
-            return str(raised_exception)
\ No newline at end of file
+            return str(raised_exception)
+
+
+class JobService:
+    def __init__(
+        self,
+        db: Session,
+        job_manager: JobManager
+    ) -> None:
+        self.db = db
+        self.job_manager = job_manager
+
+    def submit_job(
+        self,
+        sql_command: str,
+        export: bool = False
+    )->Union[ServiceResult, Exception]:
+        try:
+            job = self.job_manager.submit(self.db, sql_command=sql_command, export=export)
+            return success_service_result(JobOut.model_validate(job))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def get_job(
+        self,
+        job_id: str
+    )->Union[ServiceResult, Exception]:
+        try:
+            job = self.job_manager.get_job(self.db, job_id)
+            return success_service_result(JobOut.model_validate(job))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def cancel_job(
+        self,
+        job_id: str
+    )->Union[ServiceResult, Exception]:
+        try:
+            job = self.job_manager.cancel(self.db, job_id)
+            return success_service_result(JobOut.model_validate(job))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def get_job_result(
+        self,
+        job_id: str,
+        skip: int = 0,
+        limit: int = 100
+    )->Union[ServiceResult, Exception]:
+        try:
+            result = self.job_manager.get_result_page(self.db, job_id=job_id, skip=skip, limit=limit)
+            return success_service_result(JobResultOut.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def get_job_export_path(
+        self,
+        job_id: str
+    )->Union[ServiceResult, Exception]:
+        try:
+            return success_service_result(self.job_manager.get_export_path(self.db, job_id))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+
+class RetentionService:
+    def __init__(
+        self,
+        db: Session
+    ) -> None:
+        self.crud = DataBaseCrud(db=db)
+
+    def set_retention_policy(
+        self,
+        data: RetentionPolicyIn
+    )->Union[ServiceResult, Exception]:
+        try:
+            result = self.crud.set_retention_policy(
+                table_name=data.table_name,
+                keep_days=data.keep_days,
+                batch_size=data.batch_size,
+                sleep_ms=data.sleep_ms,
+                enabled=data.enabled
+            )
+            return success_service_result(RetentionPolicyOut.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def get_retention_policies(self)->Union[ServiceResult, Exception]:
+        try:
+            result = {
+                "policies": self.crud.get_retention_policies()
+            }
+            return success_service_result(RetentionPoliciesOut.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
+
+    def delete_retention_policy(
+        self,
+        table_name: str
+    )->Union[ServiceResult, Exception]:
+        try:
+            result = self.crud.delete_retention_policy(table_name=table_name)
+            return success_service_result(DeleteResponse.model_validate(result))
+        except Exception as raised_exception:
+            return failed_service_result(raised_exception)
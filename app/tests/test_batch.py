@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from crud import DataBaseCrud
+from schemas import BatchOperation
+
+
+@pytest.fixture
+def crud(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        connection.execute(text("CREATE TABLE events (name TEXT)"))
+        connection.execute(text("INSERT INTO users (id, name) VALUES (1, 'a')"))
+    yield DataBaseCrud(db=Session(bind=engine))
+    engine.dispose()
+
+
+def user_names(crud):
+    with crud.db.bind.connect() as connection:
+        return connection.execute(text("SELECT name FROM users ORDER BY id")).scalars().all()
+
+
+@pytest.mark.parametrize("operations, message", [
+    ([], "at least one operation"),
+    ([BatchOperation(operation="upsert", table_name="users")], "Operation 0: unsupported operation 'upsert'"),
+    ([BatchOperation(operation="insert", table_name="users;drop")], "Operation 0: invalid table name"),
+    ([BatchOperation(operation="delete", table_name="users")], "Operation 0: id is required for delete"),
+    ([BatchOperation(operation="update", table_name="events", id=1, data={"name": "b"})],
+     "Operation 0: table 'events' has no id column to update by"),
+])
+def test_invalid_batches_are_rejected(crud, operations, message):
+    with pytest.raises(ValueError, match=message):
+        crud.execute_batch(operations)
+
+
+def test_validation_runs_before_any_operation(crud):
+    operations = [
+        BatchOperation(operation="insert", table_name="users", data={"name": "b"}),
+        BatchOperation(operation="delete", table_name="events", id=1),
+    ]
+
+    with pytest.raises(ValueError, match="Operation 1: table 'events' has no id column"):
+        crud.execute_batch(operations)
+    assert user_names(crud) == ["a"]
+
+
+def test_failing_operation_rolls_back_the_batch(crud):
+    operations = [
+        BatchOperation(operation="insert", table_name="users", data={"name": "b"}),
+        BatchOperation(operation="update", table_name="users", id=42, data={"name": "c"}),
+    ]
+
+    with pytest.raises(ValueError, match="Operation 1: no record found with id 42"):
+        crud.execute_batch(operations)
+    assert user_names(crud) == ["a"]
+
+
+def test_valid_batch_returns_each_result(crud):
+    result = crud.execute_batch([
+        BatchOperation(operation="insert", table_name="users", data={"id": 2, "name": "b"}),
+        BatchOperation(operation="update", table_name="users", id=1, data={"name": "z"}),
+        BatchOperation(operation="delete", table_name="users", id=2),
+    ])
+
+    assert [(item["operation"], item["rows_affected"]) for item in result["results"]] == [
+        ("insert", 1), ("update", 1), ("delete", 1),
+    ]
+    assert result["results"][1]["data"] == {"id": 1, "name": "z"}
+    assert user_names(crud) == ["z"]
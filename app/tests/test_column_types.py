@@ -0,0 +1,102 @@
+import base64
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.types import BigInteger, Date, DateTime, Float, LargeBinary, Numeric, String
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from crud import resolve_column_type
+from requestSerialization import bind_row, bind_value
+
+
+@pytest.mark.parametrize("type_name, expected_type", [
+    ("string", String),
+    ("BigInt", BigInteger),
+    ("timestamptz", DateTime),
+    ("date", Date),
+    ("uuid", PG_UUID),
+    ("bytea", LargeBinary),
+    ("numeric", Numeric),
+])
+def test_resolve_plain_types(type_name, expected_type):
+    assert isinstance(resolve_column_type(type_name), expected_type)
+
+
+def test_resolve_timestamptz_keeps_timezone():
+    assert resolve_column_type("timestamptz").timezone
+
+
+def test_resolve_numeric_precision_and_scale():
+    column_type = resolve_column_type("numeric(18, 5)")
+
+    assert isinstance(column_type, Numeric)
+    assert (column_type.precision, column_type.scale) == (18, 5)
+
+
+def test_resolve_varchar_length():
+    column_type = resolve_column_type("varchar(64)")
+
+    assert isinstance(column_type, String)
+    assert column_type.length == 64
+
+
+@pytest.mark.parametrize("type_name", ["money", "varchar(10, 2)", "numeric(a)", "string(10)"])
+def test_resolve_unsupported_types(type_name):
+    with pytest.raises(Exception, match="Unsupported data type"):
+        resolve_column_type(type_name)
+
+
+def test_bind_numeric_keeps_precision():
+    assert bind_value(Numeric(18, 5), 1.1) == Decimal("1.1")
+    assert bind_value(Numeric(18, 5), "12345678901234.12345") == Decimal("12345678901234.12345")
+
+
+def test_bind_float_stays_float():
+    assert bind_value(Float(), "1.5") == 1.5
+
+
+def test_bind_integer_from_string():
+    assert bind_value(BigInteger(), "9007199254740993") == 9007199254740993
+
+
+def test_bind_uuid_from_string():
+    value = "2b1e7f1c-8d4a-4d6a-9a47-3f0a1d6c9e11"
+
+    assert bind_value(PG_UUID(), value) == UUID(value)
+
+
+def test_bind_bytea_from_base64():
+    assert bind_value(LargeBinary(), base64.b64encode(b"\x00\xff").decode()) == b"\x00\xff"
+
+
+def test_bind_datetime_strings_pass_through():
+    # postgres parses them, it accepts more formats than fromisoformat
+    assert bind_value(DateTime(timezone=True), "2024-05-01 10:00:00Z") == "2024-05-01 10:00:00Z"
+    moment = datetime(2024, 5, 1)
+    assert bind_value(DateTime(), moment) is moment
+
+
+def test_bind_none_stays_none():
+    assert bind_value(Numeric(18, 5), None) is None
+
+
+@pytest.mark.parametrize("column_type, value", [
+    (Numeric(18, 5), "not a number"),
+    (BigInteger(), "1.5"),
+    (PG_UUID(), "not-a-uuid"),
+    (LargeBinary(), "AP8=!"),
+    (LargeBinary(), "not base64"),
+])
+def test_bind_invalid_values_raise(column_type, value):
+    with pytest.raises((ArithmeticError, ValueError)):
+        bind_value(column_type, value)
+
+
+def test_bind_row_reports_invalid_bytea():
+    table = Table("files", MetaData(), Column("content", LargeBinary()))
+
+    with pytest.raises(ValueError, match="Invalid value for column 'content'"):
+        bind_row(table, {"content": "AP8=!"})
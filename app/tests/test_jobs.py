@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from config import Settings
+from jobs import JOB_CANCELLED, JOB_FAILED, JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED, JobManager
+from models import QueryJob
+
+
+@pytest.fixture
+def job_manager(tmp_path):
+    settings = Settings()
+    settings.job_export_dir = str(tmp_path)
+    manager = JobManager(app_settings=settings)
+    manager._engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    manager._executor = ThreadPoolExecutor(max_workers=1)
+    with manager._engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        connection.execute(text("INSERT INTO users (name) VALUES ('a'), ('b'), ('c')"))
+
+    streamed = {}
+
+    @event.listens_for(manager._engine, "before_cursor_execute")
+    def record_streaming(conn, cursor, statement, parameters, context, executemany):
+        streamed[statement] = bool(context.execution_options.get("stream_results"))
+
+    manager.streamed = streamed
+    yield manager
+    manager._executor.shutdown(wait=True)
+    manager._engine.dispose()
+
+
+def run_job(job_manager, sql_command, export=False):
+    db = Session(bind=job_manager._engine)
+    job_id = job_manager.submit(db, sql_command, export=export)["job_id"]
+    job_manager._executor.shutdown(wait=True)
+    return job_manager.get_job(db, job_id)
+
+
+def test_write_job_succeeds_without_streaming(job_manager):
+    sql_command = "UPDATE users SET name = 'z' WHERE id < 3"
+    job = run_job(job_manager, sql_command)
+
+    assert job["status"] == JOB_SUCCEEDED
+    assert job["rows_count"] == 2
+    assert job_manager.streamed[sql_command] is False
+
+
+def test_read_job_streams_rows_to_result_file(job_manager):
+    sql_command = "SELECT id, name FROM users ORDER BY id"
+    job = run_job(job_manager, sql_command)
+
+    assert job["status"] == JOB_SUCCEEDED
+    assert job["rows_count"] == 3
+    assert job_manager.streamed[sql_command] is True
+
+    page = job_manager.get_result_page(Session(bind=job_manager._engine), job["job_id"], skip=1, limit=1)
+    assert page["rows"] == [{"id": 2, "name": "b"}]
+
+
+def test_jobs_of_a_dead_worker_are_finished(job_manager):
+    db = Session(bind=job_manager._engine)
+    job_manager._ensure_table(db)
+    stale, fresh = time.time() - job_manager.heartbeat_timeout_seconds - 1, time.time()
+    with db.begin():
+        for job_id, status, heartbeat_at, cancel_requested in [
+            ("dead-running", JOB_RUNNING, stale, False),
+            ("dead-cancelled", JOB_PENDING, stale, True),
+            ("alive", JOB_RUNNING, fresh, False),
+        ]:
+            db.add(QueryJob(
+                job_id=job_id, status=status, sql_command="SELECT 1", export=False,
+                submitted_at=stale, rows_count=0, cancel_requested=cancel_requested,
+                worker_id="gone", heartbeat_at=heartbeat_at,
+            ))
+
+    with job_manager._engine.begin() as connection:
+        job_manager._fail_abandoned_jobs(connection)
+
+    assert job_manager.get_job(db, "dead-running")["status"] == JOB_FAILED
+    assert job_manager.get_job(db, "dead-cancelled")["status"] == JOB_CANCELLED
+    assert job_manager.get_job(db, "alive")["status"] == JOB_RUNNING
+
+
+def test_heartbeat_keeps_owned_jobs_alive(job_manager):
+    db = Session(bind=job_manager._engine)
+    job_manager._ensure_table(db)
+    with db.begin():
+        db.add(QueryJob(
+            job_id="owned", status=JOB_RUNNING, sql_command="SELECT 1", export=False,
+            submitted_at=0, rows_count=0, cancel_requested=False, worker_id="other", heartbeat_at=0,
+        ))
+
+    with job_manager._engine.begin() as connection:
+        job_manager._heartbeat(connection, ["owned"])
+        job_manager._fail_abandoned_jobs(connection)
+
+    assert job_manager.get_job(db, "owned")["status"] == JOB_RUNNING
@@ -0,0 +1,77 @@
+import contextvars
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from profiling import (
+    TimedQueuePool,
+    _active_phases,
+    format_server_timing,
+    install_query_timing,
+    start_request_timing,
+    timed_phase,
+)
+
+
+def in_request(function):
+    # each test gets its own context, as each request does
+    return contextvars.copy_context().run(function)
+
+
+def test_phases_are_noops_outside_a_request():
+    def run():
+        with timed_phase("reflect") as phase:
+            pass
+        return phase.timings
+
+    assert in_request(run) is None
+
+
+def test_nested_phase_time_is_not_counted_twice():
+    def run():
+        timings = start_request_timing()
+        with timed_phase("reflect"):
+            time.sleep(0.02)
+            with timed_phase("sql"):
+                time.sleep(0.05)
+        return timings
+
+    timings = in_request(run)
+
+    assert timings["sql"] >= 50
+    assert 20 <= timings["reflect"] < 50
+
+
+def test_repeated_phases_add_up():
+    def run():
+        timings = start_request_timing()
+        for _ in range(2):
+            with timed_phase("encode"):
+                time.sleep(0.01)
+        return timings
+
+    assert in_request(run)["encode"] >= 20
+
+
+def test_failed_statement_closes_its_sql_phase():
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool)
+    install_query_timing(engine)
+
+    def run():
+        timings = start_request_timing()
+        with timed_phase("reflect"):
+            with engine.connect() as connection:
+                with pytest.raises(Exception):
+                    connection.execute(text("SELECT * FROM missing"))
+                connection.execute(text("SELECT 1"))
+        return timings, list(_active_phases.get())
+
+    timings, open_phases = in_request(run)
+
+    assert open_phases == []
+    assert set(timings) == {"pool", "sql", "reflect"}
+
+
+def test_format_server_timing():
+    assert format_server_timing({"sql": 1.234, "total": 5}) == "sql;dur=1.23, total;dur=5.00"
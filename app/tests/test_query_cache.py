@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from config import Settings
+from query_cache import QueryResultCache
+from services import DataBaseService
+
+
+def make_cache(**overrides):
+    options = {"ttl_seconds": 60, "max_entries": 16, "max_rows": 1000}
+    options.update(overrides)
+    return QueryResultCache(**options)
+
+
+def test_hit_does_not_reload():
+    cache = make_cache()
+    loads = []
+    loader = lambda: loads.append(1) or "page"
+
+    assert cache.get_or_load("users", (0, 10), loader) == "page"
+    assert cache.get_or_load("users", (0, 10), loader) == "page"
+    assert len(loads) == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = make_cache()
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return "page"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("users", "key", loader)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert loads == [1]
+    assert results == ["page"] * 8
+
+
+def test_loader_error_reaches_waiters_and_is_not_cached():
+    cache = make_cache()
+    release = threading.Event()
+
+    def failing_loader():
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_load("users", "key", failing_loader)
+        except ValueError as raised_exception:
+            errors.append(str(raised_exception))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["boom"] * 3
+    assert cache.get_or_load("users", "key", lambda: "page") == "page"
+
+
+def test_invalidate_drops_only_that_table():
+    cache = make_cache()
+    cache.get_or_load("users", "key", lambda: "old users")
+    cache.get_or_load("orders", "key", lambda: "old orders")
+
+    cache.invalidate("users")
+
+    assert cache.get_or_load("users", "key", lambda: "new users") == "new users"
+    assert cache.get_or_load("orders", "key", lambda: "new orders") == "old orders"
+
+
+@pytest.mark.parametrize("invalidate", [
+    lambda cache: cache.invalidate("users"),
+    lambda cache: cache.invalidate_all(),
+])
+def test_load_started_before_invalidation_is_not_stored(invalidate):
+    cache = make_cache()
+
+    def loader():
+        # a write lands while this page is being read
+        invalidate(cache)
+        return "stale"
+
+    assert cache.get_or_load("users", "key", loader) == "stale"
+    assert cache.get_or_load("users", "key", lambda: "fresh") == "fresh"
+
+
+def test_expired_entries_are_reloaded():
+    cache = make_cache(ttl_seconds=0.05)
+    cache.get_or_load("users", "key", lambda: "old")
+    time.sleep(0.1)
+
+    assert cache.get_or_load("users", "key", lambda: "new") == "new"
+
+
+def test_disabled_cache_always_loads():
+    cache = make_cache(ttl_seconds=0)
+    cache.get_or_load("users", "key", lambda: "old")
+
+    assert cache.get_or_load("users", "key", lambda: "new") == "new"
+
+
+def test_row_budget_evicts_least_recently_used():
+    cache = make_cache(max_rows=10)
+    row_count = lambda page: len(page)
+    cache.get_or_load("users", "a", lambda: [1] * 6, row_count)
+    cache.get_or_load("users", "b", lambda: [2] * 6, row_count)
+
+    assert cache.get_or_load("users", "b", lambda: [], row_count) == [2] * 6
+    assert cache.get_or_load("users", "a", lambda: [], row_count) == []
+
+
+def test_pages_larger_than_row_budget_are_not_stored():
+    cache = make_cache(max_rows=10)
+    row_count = lambda page: len(page)
+    cache.get_or_load("users", "key", lambda: [1] * 11, row_count)
+
+    assert cache.get_or_load("users", "key", lambda: "reloaded", row_count) == "reloaded"
+
+
+def test_reads_after_own_write_skip_the_page_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        connection.execute(text("INSERT INTO users (name) VALUES ('a')"))
+    cache = make_cache()
+
+    def get_names(read_after_write):
+        db = Session(bind=engine)
+        db.info["read_after_write"] = read_after_write
+        service = DataBaseService(db=db, app_settings=Settings())
+        service.query_cache = cache
+        return [row["name"] for row in service.get_datas("users", order_by="id").data.data]
+
+    assert get_names(False) == ["a"]
+    # written through another worker, this worker's cache was not invalidated
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (name) VALUES ('b')"))
+
+    assert get_names(False) == ["a"]
+    assert get_names(True) == ["a", "b"]
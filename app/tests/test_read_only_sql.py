@@ -0,0 +1,31 @@
+import pytest
+
+from database import is_read_only_sql
+
+
+@pytest.mark.parametrize("sql_command", [
+    "SELECT * FROM users",
+    "  select id from users where id = 1;  ",
+    "-- latest first\nSELECT * FROM users ORDER BY id DESC",
+    "/* report */ WITH recent AS (SELECT * FROM users) SELECT * FROM recent",
+    "EXPLAIN SELECT * FROM users",
+    "SHOW statement_timeout",
+])
+def test_plain_reads_are_read_only(sql_command):
+    assert is_read_only_sql(sql_command)
+
+
+@pytest.mark.parametrize("sql_command", [
+    "",
+    "INSERT INTO users (id) VALUES (1)",
+    "UPDATE users SET name = 'a'",
+    "DELETE FROM users",
+    "SELECT 1; DELETE FROM users",
+    "WITH gone AS (DELETE FROM users RETURNING *) SELECT * FROM gone",
+    "SELECT * INTO users_copy FROM users",
+    "SELECT * FROM users FOR UPDATE",
+    "EXPLAIN ANALYZE DELETE FROM users",
+    "CREATE TABLE users (id int)",
+])
+def test_writes_and_multiple_statements_are_not_read_only(sql_command):
+    assert not is_read_only_sql(sql_command)
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import create_engine
+from starlette.requests import Request
+
+from database import ReplicaRouter, get_request_write_lsn, parse_lsn
+
+
+@pytest.fixture
+def router():
+    router = ReplicaRouter(
+        primary=create_engine("sqlite://"),
+        replicas=[create_engine("sqlite://"), create_engine("sqlite://")],
+        read_after_write_seconds=5,
+    )
+    yield router
+    router.dispose()
+
+
+def request_with(headers):
+    return Request({"type": "http", "headers": [(name.encode(), value.encode()) for name, value in headers]})
+
+
+def test_parse_lsn_orders_positions():
+    assert parse_lsn("0/16B3748") < parse_lsn("0/16B3749") < parse_lsn("1/0")
+    assert parse_lsn(None) is None
+
+
+def test_write_position_from_header_or_cookie():
+    assert get_request_write_lsn(request_with([("x-write-lsn", "0/10")])) == 16
+    assert get_request_write_lsn(request_with([("cookie", 'write_lsn="0/10"')])) == 16
+    assert get_request_write_lsn(request_with([("x-write-lsn", "garbage")])) is None
+    assert get_request_write_lsn(request_with([])) is None
+
+
+def test_unprobed_or_down_replicas_are_skipped(router):
+    assert router.route_read() == (router.primary, False)
+
+    router._status[1] = (0.0, parse_lsn("0/10"))
+    assert router.route_read()[0] is router.replicas[1]
+
+
+def test_lagging_replicas_are_skipped(router):
+    router.max_lag_seconds = 5
+    router._status[0] = (30.0, parse_lsn("0/10"))
+    router._status[1] = (1.0, parse_lsn("0/10"))
+
+    assert {router.route_read()[0] for _ in range(4)} == {router.replicas[1]}
+
+
+def test_reads_after_a_write_need_a_caught_up_replica(router):
+    router._status[0] = (0.0, parse_lsn("0/10"))
+    router._status[1] = (0.0, parse_lsn("0/20"))
+
+    assert {router.route_read(parse_lsn("0/18")) for _ in range(4)} == {(router.replicas[1], True)}
+    assert router.route_read(parse_lsn("0/30")) == (router.primary, True)
+
+
+def test_no_replicas_reads_from_primary():
+    primary = create_engine("sqlite://")
+
+    assert ReplicaRouter(primary=primary, replicas=[]).route_read() == (primary, False)
@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import main
+from crud import MAX_EXACT_COUNT_TIMEOUT_MS, DataBaseCrud
+from dependencies import initiate_database_service
+
+
+@pytest.fixture
+def client():
+    # the bounds are checked before the service (and a database) is needed
+    main.app.dependency_overrides[initiate_database_service] = lambda: None
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("timeout_ms", [0, -1, MAX_EXACT_COUNT_TIMEOUT_MS + 1])
+def test_endpoint_rejects_timeouts_out_of_bounds(client, timeout_ms):
+    response = client.get(
+        "/get-table-stats",
+        params={"table_name": "users", "exact_count": True, "exact_count_timeout_ms": timeout_ms},
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("timeout_ms", [0, MAX_EXACT_COUNT_TIMEOUT_MS + 1])
+def test_crud_rejects_timeouts_out_of_bounds(timeout_ms):
+    crud = DataBaseCrud(db=Session(bind=create_engine("sqlite://")))
+
+    with pytest.raises(ValueError, match=f"between 1 and {MAX_EXACT_COUNT_TIMEOUT_MS}"):
+        crud.get_table_stats("users", exact_count=True, exact_count_timeout_ms=timeout_ms)